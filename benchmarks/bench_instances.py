@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+'''
+Memory and CPU of materializing query results: kiwi instances against
+boto ``Item`` wrappers (the representation used before), without network.
+
+    python benchmarks/bench_instances.py [count]
+'''
+
+from __future__ import print_function
+
+import gc
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:     # python 2
+    tracemalloc = None
+
+from boto.dynamodb2.types import NUMBER
+
+from kiwi import *
+from kiwi import dynamo
+
+
+metadata = MetaData(connection=dynamo.DynamoDBConnection(
+    host='localhost', port=8000, aws_access_key_id='bench',
+    aws_secret_access_key='bench', is_secure=False))
+
+
+class Event(Table):
+    __metadata__ = metadata
+    user_id = HashKeyField(data_type=NUMBER)
+    time = RangeKeyField(data_type=NUMBER)
+    name = Field()
+    kind = Field()
+    duration = Field(data_type=NUMBER)
+    result = Field()
+
+
+FIELDS = ['user_id', 'time', 'name', 'kind', 'duration', 'result']
+
+
+def raw_items(count):
+    return [{'user_id': {'N': str(i % 100)},
+             'time': {'N': str(i)},
+             'name': {'S': 'event-%d' % i},
+             'kind': {'S': 'click'},
+             'duration': {'N': '%d.5' % (i % 60)}}
+            for i in range(count)]
+
+
+def boto_items(items):
+    ''' The former path: a boto Item per result (data, a deep copy of it
+    and the table) read through ``in`` then ``[]`` as ``Field.__get__`` did
+    '''
+    table = Event.__mapper__.table
+    results = []
+    for raw in items:
+        item = dynamo.Item(table)
+        item.load({'Item': raw})
+        results.append(item)
+    for item in results:
+        for name in FIELDS:
+            if name not in item:
+                item[name] = None
+            item[name]
+    return results
+
+
+def kiwi_items(items):
+    results = list(Event.__mapper__.wrap_result(items))
+    for obj in results:
+        for name in FIELDS:
+            getattr(obj, name)
+    return results
+
+
+def measure(func, items):
+    gc.collect()
+    start = timeit.default_timer()
+    results = func(items)
+    elapsed = timeit.default_timer() - start
+    del results
+
+    peak = None
+    if tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        results = func(items)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del results
+    return elapsed, peak
+
+
+def main(count=100000):
+    items = raw_items(count)
+    print('%d items' % count)
+    for name, func in (('boto Item', boto_items), ('kiwi', kiwi_items)):
+        elapsed, peak = measure(func, items)
+        line = '%-10s %8.3f s' % (name, elapsed)
+        if peak is not None:
+            line += '  %8.1f MiB peak' % (peak / 1024.0 / 1024.0)
+        print(line)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+'''
+asyncio engine: speaks the DynamoDB JSON protocol over aiohttp
+
+Requests are built from the same ``Mapper``, ``Field`` and ``Expression``
+metadata as the blocking API, and signed with the credentials of the
+metadata's boto connection. This module requires python 3.5+ and aiohttp,
+and is only imported when an async API is used::
+
+    user = await User.aget(1)
+    users = await User.abatch_get([1, 2, 3])
+    async for task in UserTask.query().onkeys(UserTask.user_id == 1):
+        ...
+    await user.asave()
+'''
+
+__all__ = ['AsyncEngine', 'QueryIterator']
+
+import asyncio
+import json
+from collections import deque
+
+import aiohttp
+
+from . import dynamo
+from .retry import backoff_delay
+from .exceptions import *
+
+
+class AsyncEngine(object):
+    ''' Send DynamoDB requests with a non-blocking HTTP client.
+
+    ``connection`` is a boto ``DynamoDBConnection``, which provides the
+    endpoint, credentials and request signing. ``session`` is an optional
+    ``aiohttp.ClientSession``, created on first use otherwise.
+    '''
+    def __init__(self, connection, session=None):
+        self.connection = connection
+        self._session = session
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, action, params):
+        conn = self.connection
+        body = json.dumps(params)
+        headers = {
+            'X-Amz-Target': '%s.%s' % (conn.TargetPrefix, action),
+            'Host': conn.host,
+            'Content-Type': 'application/x-amz-json-1.0',
+            'Content-Length': str(len(body)),
+        }
+
+        attempt = 0
+        while True:
+            request = conn.build_base_http_request(
+                method='POST', path='/', auth_path='/', params={},
+                headers=headers, data=body, host=conn.host)
+            request.authorize(connection=conn)
+            url = '%s://%s:%s%s' % (request.protocol, request.host,
+                                    request.port, request.path)
+
+            async with self.session.post(url, data=body,
+                                         headers=request.headers) as resp:
+                status, reason = resp.status, resp.reason
+                data = await resp.json(content_type=None)
+
+            if status == 200:
+                return data or {}
+
+            data = data or {}
+            fault = data.get('__type', '').rsplit('#', 1)[-1]
+            attempt += 1
+            if (fault == 'ProvisionedThroughputExceededException' and
+                    attempt < conn.NumberRetries):
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            if fault == 'ValidationException':
+                exception_class = dynamo.ValidationException
+            else:
+                exception_class = conn._faults.get(fault, conn.ResponseError)
+            raise exception_class(status, reason, body=data)
+
+
+def _engine(mapper):
+    return mapper.metadata.async_engine
+
+
+async def get(mapper, *args):
+    ''' Coroutine version of ``Mapper.get``
+    '''
+    key = mapper.build_key(args)
+
+    imap = mapper.metadata.identity_map
+    if imap is not None:
+        obj = imap.get(mapper.identity_key(args))
+        if obj is not None:
+            return obj
+
+    data = await _engine(mapper).request('GetItem', {
+        'TableName': mapper.tablename,
+        'Key': mapper.encode_key(key),
+    })
+    if 'Item' not in data:
+        return None
+    return mapper.wrap_item(data['Item'])
+
+
+async def batch_get(mapper, keys, ordered=False):
+    ''' Coroutine version of ``Mapper.batch_get``: the chunks are
+    requested concurrently; a list is always returned.
+    '''
+    from .mapper import BATCH_GET_SIZE
+
+    dictkeys = mapper.build_keys(keys)
+    cached, missing = mapper.lookup_keys(dictkeys)
+
+    raw_keys = [mapper.encode_key(key) for key in missing]
+    chunks = [raw_keys[i:i + BATCH_GET_SIZE]
+              for i in range(0, len(raw_keys), BATCH_GET_SIZE)]
+    pages = await asyncio.gather(*[_batch_get_chunk(mapper, chunk)
+                                   for chunk in chunks])
+
+    for page in pages:
+        for item in page:
+            obj = mapper.wrap_item(item)
+            cached[mapper.identity_key(obj)] = obj
+    if not ordered:
+        return [obj for obj in cached.values() if obj is not None]
+    return [cached[mapper.identity_key(key)] for key in dictkeys]
+
+
+async def _batch_get_chunk(mapper, keys):
+    engine = _engine(mapper)
+    tablename = mapper.tablename
+    items = []
+    attempt = 0
+    while keys:
+        if attempt:
+            await asyncio.sleep(backoff_delay(attempt))
+        data = await engine.request('BatchGetItem', {
+            'RequestItems': {tablename: {'Keys': keys}},
+        })
+        items.extend(data.get('Responses', {}).get(tablename, []))
+        unprocessed = data.get('UnprocessedKeys', {}).get(tablename)
+        keys = unprocessed['Keys'] if unprocessed else []
+        attempt += 1
+    return items
+
+
+async def save(obj, overwrite=False):
+    ''' Coroutine version of ``TableBase.save``
+    '''
+    mapper = obj.__mapper__
+    request = mapper.save_request(obj, overwrite)
+    if request is not None:
+        await _engine(mapper).request(*request)
+    mapper.saved(obj)
+
+
+class QueryIterator(object):
+    ''' ``async for`` iterator over the results of a ``Query``, fetching
+    one page per request.
+    '''
+    def __init__(self, query):
+        self._query = query
+        self._mapper = query._mapper
+        self._params = query._request_params()
+        self._partial = bool(query._attributes) and not query._deferred
+        self._group = None
+        if query._deferred:
+            self._group = self._mapper.deferred_group()
+        self._remaining = query._limit
+        self._page = deque()
+        self._last_key = query._start_key
+        self._done = False
+        query._fired = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._page:
+            if self._done or self._remaining == 0:
+                raise StopAsyncIteration
+            await self._fetch()
+
+        item = self._page.popleft()
+        if self._remaining is not None:
+            self._remaining -= 1
+        return self._mapper.wrap_item(item, self._partial, self._group)
+
+    async def _fetch(self):
+        params = dict(self._params)
+        page_size = self._query._max_page_size
+        if self._remaining is not None:
+            page_size = min(page_size or self._remaining, self._remaining)
+        if page_size:
+            params['Limit'] = page_size
+        if self._last_key:
+            params['ExclusiveStartKey'] = self._last_key
+
+        data = await _engine(self._mapper).request('Query', params)
+
+        self._page.extend(data.get('Items', []))
+        self._last_key = data.get('LastEvaluatedKey')
+        if not self._last_key:
+            self._done = True
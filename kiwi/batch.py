@@ -1,39 +1,313 @@
 # -*- coding: utf-8 -*-
 
 from builtins import object
+from builtins import range
 
-from . import dynamo
+from collections import OrderedDict
+from concurrent.futures import Future, as_completed
+from queue import Queue, Empty
+from threading import Lock, Thread
+
+from . import mapper as _mapper
+from .retry import backoff
 from .exceptions import *
 
 
+BATCH_WRITE_SIZE = 25
+
+
+def _mapper_of(metadata, table):
+    mapper = getattr(table, '__mapper__', None)
+    if mapper is None or mapper.metadata is not metadata:
+        raise ArgumentError("`%s` is not a table of the metadata" % table)
+    return mapper
+
+
+def batch_get(metadata, requests, ordered=False):
+    ''' See :meth:`kiwi.metadata.MetaData.batch_get`
+    '''
+    plans = []
+    pending = []    # (tablename, encoded key)
+    for table, keys in requests.items():
+        mapper = _mapper_of(metadata, table)
+        dictkeys = mapper.build_keys(keys)
+        cached, missing = mapper.lookup_keys(dictkeys)
+        plans.append((table, mapper, dictkeys, cached))
+        pending.extend((mapper.tablename, mapper.encode_key(key))
+                       for key in missing)
+
+    size = _mapper.BATCH_GET_SIZE
+    chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+    if len(chunks) > 1:
+        futures = [metadata.executor.submit(_batch_get_chunk, metadata, c)
+                   for c in chunks]
+        try:
+            pages = [f.result() for f in as_completed(futures)]
+        finally:
+            for future in futures:
+                future.cancel()
+    else:
+        pages = [_batch_get_chunk(metadata, c) for c in chunks]
+
+    fetched = dict((plan[1].tablename, []) for plan in plans)
+    for page in pages:
+        for tablename, item in page:
+            fetched[tablename].append(item)
+
+    results = {}
+    for table, mapper, dictkeys, cached in plans:
+        objs = [mapper.wrap_item(item) for item in fetched[mapper.tablename]]
+        if not ordered:
+            results[table] = [obj for obj in cached.values()
+                              if obj is not None] + objs
+            continue
+        for obj in objs:
+            cached[mapper.identity_key(obj)] = obj
+        results[table] = [cached[mapper.identity_key(key)]
+                          for key in dictkeys]
+    return results
+
+
+def _batch_get_chunk(metadata, keys):
+    ''' Fetch (tablename, encoded key) pairs in one BatchGetItem, retrying
+    the unprocessed keys; returns (tablename, item) pairs
+    '''
+    request_items = {}
+    for tablename, key in keys:
+        request_items.setdefault(tablename, {'Keys': []})['Keys'].append(key)
+    items = []
+    attempt = 0
+    while request_items:
+        backoff(attempt)
+        data = metadata.request('BatchGetItem',
+                                {'RequestItems': request_items})
+        for tablename, found in data.get('Responses', {}).items():
+            items.extend((tablename, item) for item in found)
+        request_items = data.get('UnprocessedKeys') or {}
+        attempt += 1
+    return items
+
+
 class BatchWrite(object):
-    def __init__(self, mapper):
+    ''' Buffer puts and deletes, sent by BatchWriteItem in chunks of
+    ``BATCH_WRITE_SIZE``; unprocessed items are retried with backoff.
+
+    The buffer keeps one write per primary key, the last one: a put then
+    a delete of the same item only sends the delete, repeated puts only
+    send the last one. It is flushed when ``buffer_size`` keys are pending.
+    '''
+    def __init__(self, mapper, buffer_size=None):
         self._mapper = mapper
         self._class = mapper.class_
+        self._buffer_size = buffer_size or BATCH_WRITE_SIZE
+        self._requests = OrderedDict()  # identity key: (tablename, request)
 
     def __enter__(self):
-        self._batchtable = dynamo.BatchTable(self._mapper.table)
         return self
 
     def add(self, item):
+        return self._append(*self._put_request(item))
+
+    def delete(self, item):
+        return self._append(*self._delete_request(item))
+
+    def _put_request(self, item):
         if not isinstance(item, self._class):
             raise ArgumentError(
                 "item is not an instance of %s" % self._mapper.tablename)
-        self._batchtable.put_item(dict(item.items()))
+        return self._build_put(self._mapper, item)
 
-    def delete(self, item):
-        if isinstance(item, self._class):
+    def _delete_request(self, item):
+        return self._build_delete(self._mapper, item)
+
+    def _build_put(self, mapper, item):
+        request = {'PutRequest': {'Item': mapper.dump(item)}}
+        mapper.remember(item)
+        return mapper.identity_key(item), (mapper.tablename, request)
+
+    def _build_delete(self, mapper, item):
+        if isinstance(item, mapper.class_):
             kwargs = {}
-            for key in self._mapper.schema:
+            for key in mapper.schema:
                 kwargs[key.name] = getattr(item, key.name)
         elif isinstance(item, dict):
             kwargs = item
-            for key in self._mapper.schema:
+            for key in mapper.schema:
                 if key.name not in kwargs:
                     raise ArgumentError("Primary key is NOT integral")
         else:
             raise ArgumentError("Invalid type of argument")
-        self._batchtable.delete_item(**kwargs)
+        request = {'DeleteRequest': {'Key': mapper.encode_key(kwargs)}}
+        mapper.forget(kwargs)
+        return mapper.identity_key(kwargs), (mapper.tablename, request)
+
+    def _append(self, key, request):
+        # last write wins
+        self._requests[key] = request
+        if len(self._requests) >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        requests = list(self._requests.values())
+        self._requests = OrderedDict()
+        for i in range(0, len(requests), BATCH_WRITE_SIZE):
+            self._write(requests[i:i + BATCH_WRITE_SIZE])
+
+    def _write(self, requests):
+        ''' Send (tablename, request) pairs in one BatchWriteItem, retrying
+        the unprocessed items
+        '''
+        request_items = {}
+        for tablename, request in requests:
+            request_items.setdefault(tablename, []).append(request)
+        attempt = 0
+        while request_items:
+            backoff(attempt)
+            data = self._request('BatchWriteItem',
+                                 {'RequestItems': request_items})
+            request_items = data.get('UnprocessedItems') or {}
+            attempt += 1
+
+    def _request(self, action, params):
+        return self._mapper.request(action, params)
+
+    def __exit__(self, type, value, traceback):
+        self.flush()
+
+
+class BackgroundBatchWrite(BatchWrite):
+    ''' Write-behind version of ``BatchWrite``.
+
+    ``add`` and ``delete`` push the request to a bounded queue, blocking
+    only while it is full, and return a future of the write. ``workers``
+    threads drain the queue by chunks of ``BATCH_WRITE_SIZE``, issuing
+    BatchWriteItem concurrently. Writes to the same primary key drained
+    together are coalesced, the last one winning: the futures of the
+    superseded ones complete with it; writes to the same key drained by
+    different workers may be applied in any order. ``flush`` waits until
+    every queued write is done, and raises the first error since the
+    previous flush.
+    '''
+    def __init__(self, mapper, workers=None, queue_size=None):
+        super(BackgroundBatchWrite, self).__init__(mapper)
+        self._workers = workers or mapper.metadata.max_workers
+        if queue_size is None:
+            queue_size = self._workers * BATCH_WRITE_SIZE * 2
+        self._queue = Queue(maxsize=queue_size)
+        self._threads = []
+        self._errors = []
+        self._lock = Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for _ in range(self._workers):
+                thread = Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _append(self, key, request):
+        self._start()
+        future = Future()
+        self._queue.put((key, request, future))
+        return future
+
+    def _work(self):
+        stop = False
+        while not stop:
+            batch = OrderedDict()   # key: (request, futures)
+            entry = self._queue.get()
+            while True:
+                if entry is None:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                key, request, future = entry
+                if future.set_running_or_notify_cancel():
+                    futures = batch.pop(key, (None, []))[1]
+                    futures.append(future)
+                    batch[key] = (request, futures)
+                else:   # cancelled
+                    self._queue.task_done()
+                if len(batch) >= BATCH_WRITE_SIZE:
+                    break
+                try:
+                    entry = self._queue.get_nowait()
+                except Empty:
+                    break
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        futures = [f for request, fs in batch.values() for f in fs]
+        try:
+            self._write([request for request, fs in batch.values()])
+        except Exception as e:
+            with self._lock:
+                self._errors.append(e)
+            for future in futures:
+                future.set_exception(e)
+        else:
+            for future in futures:
+                future.set_result(None)
+        finally:
+            for _ in futures:
+                self._queue.task_done()
+
+    def flush(self):
+        self._queue.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        ''' Flush, then stop the workers
+        '''
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                threads, self._threads = self._threads, []
+            for _ in threads:
+                self._queue.put(None)
+            for thread in threads:
+                thread.join()
 
     def __exit__(self, type, value, traceback):
-        self._batchtable.__exit__(type, value, traceback)
+        if type is None:
+            self.close()
+            return
+        try:
+            self.close()
+        except Exception:
+            # do not hide the exception of the block
+            pass
+
+
+class MultiBatchWrite(BatchWrite):
+    ''' ``BatchWrite`` of items of any table of a metadata, packing the
+    writes of several tables into shared BatchWriteItem requests
+    '''
+    def __init__(self, metadata, buffer_size=None):
+        self._metadata = metadata
+        self._buffer_size = buffer_size or BATCH_WRITE_SIZE
+        self._requests = OrderedDict()
+
+    def delete(self, item, table=None):
+        ''' Delete an item, or the key ``item`` (a dict) of ``table``
+        '''
+        return self._append(*self._delete_request(item, table))
+
+    def _put_request(self, item):
+        return self._build_put(_mapper_of(self._metadata, type(item)), item)
+
+    def _delete_request(self, item, table=None):
+        if table is None:
+            table = type(item)
+        return self._build_delete(_mapper_of(self._metadata, table), item)
+
+    def _request(self, action, params):
+        return self._metadata.request(action, params)
@@ -4,6 +4,8 @@
 all boto.dynamodb2 import comes here
 '''
 
+import json
+
 from boto.dynamodb2.table import Table, BatchTable
 from boto.dynamodb2.fields import (HashKey, RangeKey,
                                    AllIndex, KeysOnlyIndex, IncludeIndex,
@@ -16,4 +18,27 @@ from boto.dynamodb2.types import (NonBooleanDynamizer, Dynamizer,
                                   FILTER_OPERATORS, QUERY_OPERATORS, STRING)
 
 from boto.exception import JSONResponseError
-from boto.dynamodb2.exceptions import (DynamoDBError, ItemNotFound)
+from boto.dynamodb2.exceptions import (DynamoDBError, ItemNotFound,
+                                       ValidationException,
+                                       ProvisionedThroughputExceededException)
+
+
+def clone_connection(connection):
+    ''' A new connection to the same endpoint, with the same credentials
+    '''
+    return connection.__class__(
+        host=connection.host, port=connection.port,
+        is_secure=connection.is_secure, region=connection.region,
+        provider=connection.provider,
+        proxy=connection.proxy, proxy_port=connection.proxy_port,
+        proxy_user=connection.proxy_user, proxy_pass=connection.proxy_pass,
+        validate_certs=connection.https_validate_certificates,
+        validate_checksums=connection._validate_checksums)
+
+
+def make_request(connection, action, params):
+    ''' Send a request of the DynamoDB JSON API through a boto
+    ``DynamoDBConnection``. ``params`` are in the wire format (CamelCase
+    names, encoded attribute values).
+    '''
+    return connection.make_request(action, json.dumps(params)) or {}
@@ -15,6 +15,22 @@ from .expression import Filterable
 from .exceptions import *
 
 
+class _Missing(object):
+    def __repr__(self):
+        return 'MISSING'
+
+# marks a field without value yet, whose default is applied on first access
+MISSING = _Missing()
+
+
+class _Deferred(object):
+    def __repr__(self):
+        return 'DEFERRED'
+
+# marks a field not projected by a deferred query, loaded on first access
+DEFERRED = _Deferred()
+
+
 class SchemaBase(object):
     def __init__(self, key=None, name=None):
         self.key = key
@@ -45,13 +61,26 @@ class Field(SchemaBase, Filterable):
         if obj is None:
             return self
 
-        if self.key not in obj._item:
-            obj._item[self.key] = self.default()
-
-        return obj._item[self.key]
+        values = obj._values
+        pos = obj.__mapper__.positions[self.key]
+        value = values[pos]
+        if value is MISSING:
+            value = values[pos] = self.default()
+        elif value is DEFERRED:
+            obj.__mapper__.undefer(obj)
+            return self.__get__(obj, owner)
+        return value
 
     def __set__(self, obj, value):
-        obj._item[self.key] = value
+        values = obj._values
+        pos = obj.__mapper__.positions[self.key]
+        if obj._persisted:
+            # keep the value loaded/saved last, for partial save & expects
+            if obj._orig is None:
+                obj._orig = {}
+            if self.key not in obj._orig:
+                obj._orig[self.key] = values[pos]
+        values[pos] = value
 
     def __delete__(self, obj):
         raise InvalidRequestError("Unsupport Operation")
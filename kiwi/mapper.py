@@ -3,17 +3,38 @@
 from builtins import str
 from builtins import zip
 from builtins import object
+from builtins import range
+
+import weakref
+from concurrent.futures import as_completed
+from itertools import chain
+from threading import RLock
 
 __all__ = ['Mapper', 'setup_mapping']
 
 from . import dynamo
 from .metadata import MetaData
 from .field import *
+from .field import MISSING, DEFERRED
+from .retry import backoff
 from .exceptions import *
 
 import kiwi
 
 
+BATCH_GET_SIZE = 100
+
+
+def is_storable(value):
+    ''' None, empty strings and empty sets can not be stored, but false-y
+    values like 0 and False can.
+    '''
+    if not value:
+        if value not in (0, 0.0, False):
+            return False
+    return True
+
+
 class Mapper(object):
     def __init__(self, class_, tablename, schema,
                  throughput=None, attributes=None,
@@ -32,18 +53,44 @@ class Mapper(object):
         self.indexes = indexes or {}
         self.global_indexes = global_indexes or {}
 
+        # instances keep their field values in a list, by field position
+        self.fields = list(self.attributes.values())
+        self.positions = dict((f.key, i) for i, f in enumerate(self.fields))
+
+        self._table = None
+        self._dynamizer = None
+        self._lock = RLock()
+
         self.metadata.add(self)
 
     @property
     def table(self):
-        if not hasattr(self, '_table'):
-            self._table = self._build_table(dynamo.Table)
+        ''' The boto ``Table``, used to create/drop the table
+        '''
+        if self._table is None:
+            with self._lock:
+                if self._table is None:
+                    self._table = self._build_table(dynamo.Table)
         return self._table
 
+    @property
+    def dynamizer(self):
+        if self._dynamizer is None:
+            with self._lock:
+                if self._dynamizer is None:
+                    self._dynamizer = self._build_dynamizer()
+        return self._dynamizer
+
+    def _build_dynamizer(self):
+        if self.metadata.dynamizer:
+            assert issubclass(self.metadata.dynamizer, dynamo.Dynamizer)
+            return self.metadata.dynamizer()
+        return dynamo.NonBooleanDynamizer()
+
     def _build_table(self, builder):
         kwargs = {}
         kwargs['throughput'] = self.throughput
-        kwargs['connection'] = self.metadata.connection
+        kwargs['connection'] = self.metadata.get_connection(shared=True)
 
         if self.indexes:
             kwargs['indexes'] = [idx.map() for idx in self.indexes.values()]
@@ -53,48 +100,326 @@ class Mapper(object):
 
         table = builder(self.tablename, self.schema, **kwargs)
 
-        if self.metadata.dynamizer:
-            # However, boto.dynamodb2 does not provide a public interface
-            # to custom dynamizer. Here we do it at a risk.
-            assert issubclass(self.metadata.dynamizer, dynamo.Dynamizer)
-            table._dynamizer = self.metadata.dynamizer()
+        # However, boto.dynamodb2 does not provide a public interface
+        # to custom dynamizer. Here we do it at a risk.
+        table._dynamizer = self.dynamizer
 
         return table
 
     def create_table(self):
-        self._table = self._build_table(dynamo.Table.create)
+        with self._lock:
+            self._table = self._build_table(dynamo.Table.create)
 
     def drop_table(self):
         self.table.delete()
 
-    def new_item(self, _item=None, **kwargs):
-        item = _item or dynamo.Item(self.table, data=kwargs)
-        for name, field in self.attributes.items():
-            if name not in item:
-                item[name] = field.default()
-        return item
+    def request(self, action, params):
+        ''' Send a raw request on the connection of the current thread,
+        see :meth:`kiwi.metadata.MetaData.request`
+        '''
+        return self.metadata.request(action, params)
 
-    def get_item(self, *args):
+    def init_instance(self, obj, data, persisted=False):
+        ''' Set the state of an instance from a mapping of (decoded)
+        values. The fields not in ``data`` get their default value.
         '''
-        not support `consistent`, `attributes` yet
+        values = [MISSING] * len(self.fields)
+        extra = None
+        positions = self.positions
+        for name, value in data.items():
+            pos = positions.get(name)
+            if pos is None:
+                if extra is None:
+                    extra = {}
+                extra[name] = value
+            else:
+                values[pos] = value
+        for pos, field in enumerate(self.fields):
+            if values[pos] is MISSING:
+                values[pos] = field.default()
+
+        obj._values = values
+        obj._extra = extra
+        obj._orig = None
+        obj._persisted = persisted
+        obj._deferred = None
+
+    def load(self, raw, group=None):
+        ''' Build an instance from an item in the wire format.
+
+        No snapshot is taken: the loaded values are only copied aside when
+        a field is assigned, and defaults are applied on first access.
+        With a ``group`` (see ``undefer``), the fields missing from the
+        item are deferred instead.
+        '''
+        obj = self.class_.__new__(self.class_)
+        values = [MISSING] * len(self.fields)
+        extra = None
+        positions = self.positions
+        decode = self.dynamizer.decode
+        for name, value in raw.items():
+            pos = positions.get(name)
+            if pos is None:
+                if extra is None:
+                    extra = {}
+                extra[name] = decode(value)
+            else:
+                values[pos] = decode(value)
+
+        obj._values = values
+        obj._extra = extra
+        obj._orig = None
+        obj._persisted = True
+        obj._deferred = None
+        if group is not None:
+            for pos, value in enumerate(values):
+                if value is MISSING:
+                    values[pos] = DEFERRED
+            obj._deferred = group
+            group.add(obj)
+        return obj
+
+    def undefer(self, obj):
+        ''' Load the deferred fields of ``obj``, together with the ones of
+        its siblings (the objects of the same result set), by BatchGetItem.
+        Fields assigned in the meantime are kept.
+        '''
+        group = obj._deferred
+        if group is None:
+            return
+        objs = [obj]
+        for other in list(group):
+            if len(objs) >= BATCH_GET_SIZE:
+                break
+            if other is not obj and other._deferred is group:
+                objs.append(other)
+
+        names = [k.name for k in self.schema]
+        pending = dict((tuple(getattr(o, name) for name in names), o)
+                       for o in objs)
+        items = self._batch_get_chunk([self.encode_key(o) for o in objs])
+
+        decode = self.dynamizer.decode
+        positions = self.positions
+        for item in items:
+            o = pending.get(tuple(decode(item[name]) for name in names))
+            if o is None:
+                continue
+            values = o._values
+            for name, value in item.items():
+                pos = positions.get(name)
+                if pos is None:
+                    if o._extra is None:
+                        o._extra = {}
+                    o._extra.setdefault(name, decode(value))
+                elif values[pos] is DEFERRED:
+                    values[pos] = decode(value)
+
+        for o in objs:
+            values = o._values
+            for pos, value in enumerate(values):
+                if value is DEFERRED:
+                    values[pos] = MISSING
+            o._deferred = None
+            group.discard(o)
+
+    def get_value(self, obj, name):
+        pos = self.positions.get(name)
+        if pos is None:
+            return (obj._extra or {}).get(name)
+        value = obj._values[pos]
+        if value is DEFERRED:
+            self.undefer(obj)
+            value = obj._values[pos]
+        if value is MISSING:
+            value = obj._values[pos] = self.fields[pos].default()
+        return value
+
+    def iter_items(self, obj):
+        ''' (name, value) of the fields, then of the undeclared attributes
         '''
+        if obj._deferred is not None:
+            self.undefer(obj)
+        values = obj._values
+        for pos, field in enumerate(self.fields):
+            value = values[pos]
+            if value is MISSING:
+                value = values[pos] = field.default()
+            yield field.key, value
+        if obj._extra:
+            for item in obj._extra.items():
+                yield item
+
+    def dump(self, obj):
+        ''' The item of an instance in the wire format
+        '''
+        encode = self.dynamizer.encode
+        raw = {}
+        for name, value in self.iter_items(obj):
+            if is_storable(value):
+                raw[name] = encode(value)
+        return raw
+
+    def build_key(self, args):
         if len(self.schema) != len(args):
             raise ArgumentError("args can not match the table's schema")
-        kwargs = dict()
-        for key, value in zip(self.schema, args):
-            kwargs[key.name] = value
-        try:
-            return self.table.get_item(**kwargs)
-        except dynamo.ItemNotFound:  # ItemNotFound
+        return dict((k.name, v) for k, v in zip(self.schema, args))
+
+    def encode_key(self, key):
+        ''' Encode a primary key given as a dict or an instance
+        '''
+        encode = self.dynamizer.encode
+        if isinstance(key, self.class_):
+            return dict((k.name, encode(getattr(key, k.name)))
+                        for k in self.schema)
+        return dict((k.name, encode(key[k.name])) for k in self.schema)
+
+    def get_item(self, *args):
+        '''
+        not support `consistent`, `attributes` yet
+        '''
+        key = self.build_key(args)
+        data = self.request('GetItem', {
+            'TableName': self.tablename,
+            'Key': self.encode_key(key),
+        })
+        if 'Item' not in data:
+            return None
+        return data['Item']
+
+    def get(self, *args):
+        '''
+        Get an object by primary key, consulting the identity map first
+        '''
+        imap = self.metadata.identity_map
+        if imap is not None:
+            obj = imap.get(self.identity_key(args))
+            if obj is not None:
+                return obj
+        item = self.get_item(*args)
+        if item is None:
             return None
+        return self.wrap_item(item)
 
     def delete_item(self, **kwargs):
         for key in self.schema:
             if key.name not in kwargs:
                 raise ArgumentError("Primary key is NOT integral")
-        self.table.delete_item(**kwargs)
+        self.request('DeleteItem', {
+            'TableName': self.tablename,
+            'Key': self.encode_key(kwargs),
+        })
+        self.forget(kwargs)
+
+    def has_key_fields(self, names):
+        for key in self.schema:
+            if key.name in names:
+                return True
+        return False
+
+    def save_request(self, obj, overwrite=False):
+        ''' The (action, params) request saving ``obj``, None if there is
+        nothing to write.
+
+        An object loaded from dynamodb whose keys are unchanged only writes
+        its assigned fields (UpdateItem); otherwise the whole item is put.
+        Unless ``overwrite``, the request expects the item to be unchanged
+        since it was loaded, or to not exist for a new object.
+        '''
+        changed = obj._orig
+        if obj._persisted and not self.has_key_fields(changed or ()):
+            if not changed:
+                return None
+            params = {
+                'TableName': self.tablename,
+                'Key': self.encode_key(obj),
+                'AttributeUpdates': self.build_updates(obj, changed),
+            }
+            if not overwrite:
+                params['Expected'] = self.build_expects(obj, changed)
+            return 'UpdateItem', params
+
+        params = {
+            'TableName': self.tablename,
+            'Item': self.dump(obj),
+        }
+        if not overwrite:
+            if obj._persisted:
+                names = set(params['Item']) | set(changed or ())
+            else:
+                # a new item: its key must not exist yet
+                names = [k.name for k in self.schema]
+            params['Expected'] = self.build_expects(obj, names)
+        return 'PutItem', params
+
+    def saved(self, obj):
+        ''' Bookkeeping after ``obj`` is written
+        '''
+        obj._persisted = True
+        obj._orig = None
+        self.remember(obj)
+
+    def build_updates(self, obj, fields):
+        updates = {}
+        encode = self.dynamizer.encode
+        for name in fields:
+            value = self.get_value(obj, name)
+            if is_storable(value):
+                updates[name] = {'Action': 'PUT', 'Value': encode(value)}
+            else:
+                updates[name] = {'Action': 'DELETE'}
+        return updates
+
+    def build_expects(self, obj, fields):
+        ''' Expect the loaded values of ``fields``, or their absence
+        '''
+        expects = {}
+        orig = obj._orig or {}
+        encode = self.dynamizer.encode
+        for name in fields:
+            if not obj._persisted:
+                expects[name] = {'Exists': False}
+                continue
+            if name in orig:
+                value = orig[name]
+            else:
+                value = self.get_value(obj, name)
+            if value is DEFERRED:
+                # assigned before being loaded: nothing to expect
+                continue
+            if value is MISSING or not is_storable(value):
+                expects[name] = {'Exists': False}
+            else:
+                expects[name] = {'Exists': True, 'Value': encode(value)}
+        return expects
+
+    def batch_get(self, keys, ordered=False):
+        '''
+        Get items by a list of primary keys.
 
-    def batch_get(self, keys):
+        The keys are sent in chunks of ``BATCH_GET_SIZE``, concurrently on
+        the metadata's executor; unprocessed keys are retried with
+        jittered backoff. If ``ordered`` is True, a list aligned to
+        ``keys`` is returned, with None for the missing ones.
+        '''
+        dictkeys = self.build_keys(keys)
+        cached, missing = self.lookup_keys(dictkeys)
+
+        pages = self._batch_get_pages(missing)
+        if not ordered:
+            objs = (obj for obj in cached.values() if obj is not None)
+            return chain(objs, (self.wrap_item(item)
+                                for page in pages for item in page))
+
+        for page in pages:
+            for item in page:
+                obj = self.wrap_item(item)
+                cached[self.identity_key(obj)] = obj
+        return [cached[self.identity_key(key)] for key in dictkeys]
+
+    def build_keys(self, keys):
+        ''' Convert key values/tuples to dicts, checking the schema
+        '''
         schema_len = len(self.schema)
         schema_names = [k.name for k in self.schema]
         dictkeys = []
@@ -105,15 +430,119 @@ class Mapper(object):
                 raise ArgumentError("key `%s` can not match "
                                     "the table's schema" % str(key))
             dictkeys.append(dict(zip(schema_names, key)))
+        return dictkeys
 
-        if not dictkeys:
-            return []
-
-        results = self.table.batch_get(dictkeys)
-        return self.wrap_result(results)
+    def lookup_keys(self, dictkeys):
+        ''' Split keys into the objects known by the identity map (a dict
+        by identity key, None for unknown ones) and the distinct keys
+        still to fetch.
+        '''
+        imap = self.metadata.identity_map
+        cached = {}
+        missing = []
+        for key in dictkeys:
+            ikey = self.identity_key(key)
+            if ikey in cached:
+                continue
+            obj = imap.get(ikey) if imap is not None else None
+            cached[ikey] = obj
+            if obj is None:
+                missing.append(key)
+        return cached, missing
+
+    def _batch_get_pages(self, keys):
+        chunks = [[self.encode_key(key) for key in keys[i:i + BATCH_GET_SIZE]]
+                  for i in range(0, len(keys), BATCH_GET_SIZE)]
+        if not chunks:
+            return
+        if len(chunks) == 1:
+            yield self._batch_get_chunk(chunks[0])
+            return
+
+        futures = [self.metadata.executor.submit(
+                   self._batch_get_chunk, chunk) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _batch_get_chunk(self, keys):
+        ''' Fetch the items of encoded keys, retrying the unprocessed ones
+        '''
+        items = []
+        attempt = 0
+        while keys:
+            backoff(attempt)
+            data = self.request('BatchGetItem', {
+                'RequestItems': {self.tablename: {'Keys': keys}},
+            })
+            items.extend(data.get('Responses', {}).get(self.tablename, []))
+            unprocessed = data.get('UnprocessedKeys', {}).get(self.tablename)
+            keys = unprocessed['Keys'] if unprocessed else []
+            attempt += 1
+        return items
+
+    def identity_key(self, key):
+        ''' Build the identity map key from a key tuple, a dict
+        or an instance of the mapped class.
+        '''
+        if isinstance(key, (tuple, list)):
+            values = tuple(key)
+        elif isinstance(key, self.class_):
+            values = tuple(getattr(key, k.name) for k in self.schema)
+        else:
+            values = tuple(key[k.name] for k in self.schema)
+        return (self.tablename, values)
+
+    def remember(self, obj):
+        imap = self.metadata.identity_map
+        if imap is not None:
+            imap.add(self.identity_key(obj), obj)
+
+    def forget(self, key):
+        imap = self.metadata.identity_map
+        if imap is not None:
+            imap.discard(self.identity_key(key))
+
+    def wrap_item(self, item, partial=False, group=None):
+        ''' Build an instance of the mapped class from an item in the
+        wire format.
+
+        If an identity map is active, the already known object for the
+        same primary key is returned instead.  A ``partial`` item (from a
+        projected query) is never registered into the identity map, unlike
+        an item whose missing fields are deferred into ``group``.
+        '''
+        imap = self.metadata.identity_map
+        if imap is None:
+            return self.load(item, group)
+        try:
+            decode = self.dynamizer.decode
+            key = (self.tablename,
+                   tuple(decode(item[k.name]) for k in self.schema))
+        except KeyError:
+            # keys not projected
+            return self.load(item, group)
+        obj = imap.get(key)
+        if obj is None:
+            obj = self.load(item, group)
+            if not partial:
+                imap.add(key, obj)
+        return obj
+
+    def wrap_result(self, results, partial=False, deferred=False):
+        ''' Wrap items. If ``deferred``, their missing fields are loaded
+        on first access, in batches across the whole result.
+        '''
+        group = self.deferred_group() if deferred else None
+        return (self.wrap_item(item, partial, group) for item in results)
 
-    def wrap_result(self, results):
-        return (self.class_(_item=item) for item in results)
+    def deferred_group(self):
+        ''' The siblings whose deferred fields are loaded together
+        '''
+        return weakref.WeakSet()
 
 
 def setup_mapping(cls, clsname, dict_):
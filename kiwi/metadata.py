@@ -5,13 +5,20 @@ from builtins import object
 __all__ = ['MetaData']
 
 import re
-from threading import RLock
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import RLock, local
 
 import kiwi
 from . import dynamo
+from .session import IdentityMap
+from .throttle import CapacityLimiter
 from .exceptions import *
 
 
+DEFAULT_MAX_WORKERS = 8
+
+
 def _tablename_factory(cls):
     clsname = cls.__name__
     return re.sub('([^A-Z])([A-Z])', '\\1_\\2', clsname).lower()
@@ -21,9 +28,23 @@ class MetaData(object):
     def __init__(self, connection=None,
                  tablename_factory=None,
                  throughput=None,
-                 dynamizer=None):
+                 dynamizer=None,
+                 max_workers=None,
+                 async_engine=None,
+                 limiter=None,
+                 connection_factory=None):
         self.connection = connection or None
+        self.connection_factory = None
+        if connection_factory:
+            self._set_connection_factory(connection_factory)
+        self._default_connection = None
         self.throughput = throughput or None
+        self.max_workers = max_workers or DEFAULT_MAX_WORKERS
+        self._executor = None
+        self._async_engine = async_engine
+        self.limiter = None
+        if limiter:
+            self._set_limiter(limiter)
         self.tablename_factory = _tablename_factory
         if tablename_factory:
             self.tablename_factory = tablename_factory
@@ -35,11 +56,16 @@ class MetaData(object):
         self._lock = RLock()
         self._unconfigurable = False
         self._tables = {}   # tablename: mapper
+        self._local = local()
 
     def configure(self, connection=None,
                   tablename_factory=None,
                   throughput=None,
-                  dynamizer=None):
+                  dynamizer=None,
+                  max_workers=None,
+                  async_engine=None,
+                  limiter=None,
+                  connection_factory=None):
         with self._lock:
             if self._unconfigurable:
                 raise InvalidRequestError("The metadata can NOT be "
@@ -53,6 +79,14 @@ class MetaData(object):
                 self.throughput = throughput or None
             if dynamizer is not None:
                 self._set_dynamizer(dynamizer)
+            if max_workers is not None:
+                self.max_workers = max_workers or DEFAULT_MAX_WORKERS
+            if async_engine is not None:
+                self._async_engine = async_engine
+            if limiter is not None:
+                self._set_limiter(limiter)
+            if connection_factory is not None:
+                self._set_connection_factory(connection_factory)
 
     def _set_dynamizer(self, dynamizer):
         if not issubclass(dynamizer, dynamo.Dynamizer):
@@ -60,6 +94,129 @@ class MetaData(object):
                                 "boto.dynamodb2.Dynamizer")
         self.dynamizer = dynamizer
 
+    def _set_limiter(self, limiter):
+        if limiter is True:
+            limiter = CapacityLimiter()
+        if limiter and not isinstance(limiter, CapacityLimiter):
+            raise ArgumentError("limiter must be an instance of "
+                                "kiwi.throttle.CapacityLimiter")
+        self.limiter = limiter or None
+
+    def _set_connection_factory(self, factory):
+        if factory is True:
+            factory = self._clone_connection
+        if factory and not callable(factory):
+            raise ArgumentError("connection_factory must be callable")
+        self.connection_factory = factory or None
+
+    def _clone_connection(self):
+        return dynamo.clone_connection(self.get_connection(shared=True))
+
+    def get_connection(self, shared=False):
+        ''' The connection of the current thread.
+
+        With a ``connection_factory`` (``True`` clones ``connection``),
+        every thread gets its own connection, and so its own keep-alive
+        HTTP connections. Otherwise, or if ``shared``, ``connection`` is
+        returned, or a default boto connection if none is configured.
+        '''
+        if shared or self.connection_factory is None:
+            if self.connection is not None:
+                return self.connection
+            with self._lock:
+                if self._default_connection is None:
+                    self._default_connection = dynamo.DynamoDBConnection()
+            return self._default_connection
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.connection_factory()
+        return connection
+
+    @property
+    def executor(self):
+        ''' The thread pool shared by concurrent operations (e.g. the
+        chunks of ``batch_get``), created on first use.
+        '''
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers)
+        return self._executor
+
+    @property
+    def async_engine(self):
+        ''' The engine of the coroutine APIs (``aget``, ``asave``, ...).
+        Defaults to a :class:`kiwi.aio.AsyncEngine` on the connection.
+        '''
+        if self._async_engine is None:
+            from .aio import AsyncEngine
+            with self._lock:
+                if self._async_engine is None:
+                    self._async_engine = AsyncEngine(
+                        self.get_connection(shared=True))
+        return self._async_engine
+
+    @property
+    def identity_map(self):
+        ''' The identity map of the innermost active session of the
+        current thread, or None if no session is active.
+        '''
+        stack = getattr(self._local, 'sessions', None)
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def session(self, maxsize=1000):
+        ''' Activate an identity map for the current thread.
+
+        Within the block, ``get``, ``batch_get`` and query iteration of
+        tables in this metadata return one shared object per primary key,
+        and repeated ``get`` calls are served without a round trip::
+
+            with metadata.session():
+                assert User.get(1) is User.get(1)
+        '''
+        imap = IdentityMap(maxsize)
+        stack = getattr(self._local, 'sessions', None)
+        if stack is None:
+            stack = self._local.sessions = []
+        stack.append(imap)
+        try:
+            yield imap
+        finally:
+            stack.remove(imap)
+            imap.clear()
+
+    def request(self, action, params, connection=None):
+        ''' Send a raw request (see :func:`kiwi.dynamo.make_request`) on
+        ``connection``, or the metadata's one, through the limiter if any.
+        Every data operation of the tables goes through here.
+        '''
+        connection = connection or self.get_connection()
+        if self.limiter is not None:
+            return self.limiter.request(self, connection, action, params)
+        return dynamo.make_request(connection, action, params)
+
+    def batch_get(self, requests, ordered=False):
+        ''' Get items of several tables, ``requests`` mapping tables to
+        lists of keys, with as few BatchGetItem requests as possible::
+
+            results = metadata.batch_get({User: [1, 2], UserTask: [(1, 3)]})
+            users = results[User]
+
+        The results are lists per table, aligned to the keys if ``ordered``
+        (see ``Table.batch_get``).
+        '''
+        from .batch import batch_get
+        return batch_get(self, requests, ordered=ordered)
+
+    def batch_write(self, buffer_size=None):
+        ''' A batch writer of items of any table of the metadata, see
+        :class:`~kiwi.batch.MultiBatchWrite`
+        '''
+        from .batch import MultiBatchWrite
+        return MultiBatchWrite(self, buffer_size=buffer_size)
+
     def add(self, mapper):
         with self._lock:
             self._unconfigurable = True
@@ -75,6 +232,9 @@ class MetaData(object):
 
             kiwi.metadatas.add(self)
 
+    def get_mapper(self, tablename):
+        return self._tables.get(tablename)
+
     def __contains__(self, mapper):
         return mapper.tablename in self._tables
 
@@ -1,21 +1,225 @@
 from builtins import object
+from builtins import range
 # -*- coding: utf-8 -*-
 
-__all__ = ['Query']
+__all__ = ['Query', 'Scan', 'Page']
 
+import base64
+import binascii
+import json
+from itertools import islice
+from queue import Queue, Full
+from threading import Event
+
+from . import dynamo
 from .field import Index
 from .expression import Expression
 from .exceptions import *
 
 
-class Query(object):
+def encode_cursor(last_key):
+    ''' A url-safe token of a ``LastEvaluatedKey``
+    '''
+    data = json.dumps(last_key, sort_keys=True).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        last_key = json.loads(data.decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError, binascii.Error):
+        raise ArgumentError("Invalid cursor `%s`" % cursor)
+    if not isinstance(last_key, dict):
+        raise ArgumentError("Invalid cursor `%s`" % cursor)
+    return last_key
+
+
+class Page(object):
+    ''' A page of results: the objects, and the ``cursor`` to resume
+    after them (None on the last page)
+    '''
+    def __init__(self, items, last_key=None, count=None, scanned_count=None):
+        self.items = items
+        self.last_key = last_key
+        self.count = count
+        self.scanned_count = scanned_count
+
+    @property
+    def cursor(self):
+        if not self.last_key:
+            return None
+        return encode_cursor(self.last_key)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class _Done(object):
+    def __init__(self, error=None):
+        self.error = error
+
+
+def _put(queue, stop, obj):
+    ''' Put into a bounded queue until the consumer stops
+    '''
+    while not stop.is_set():
+        try:
+            queue.put(obj, timeout=0.1)
+            return
+        except Full:
+            pass
+
+
+class _QueryBase(object):
+    ''' Common API of ``Query`` and ``Scan``
+    '''
+    def _check_attributes(self, attrs):
+        if not attrs:
+            return None
+        else:
+            return [f.name for f in attrs]
+
+    def _check_deferred(self, deferred):
+        if not deferred:
+            return False
+        if not self._attributes:
+            raise ArgumentError("deferred requires projected attributes")
+        # the keys are needed to load the deferred fields
+        for key in self._mapper.schema:
+            if key.name not in self._attributes:
+                self._attributes.append(key.name)
+        return True
+
+    def _wrap(self, items):
+        if self._deferred:
+            return self._mapper.wrap_result(items, deferred=True)
+        return self._mapper.wrap_result(items,
+                                        partial=bool(self._attributes))
+
+    def _build_raw_filters(self, filters):
+        return dict(map(lambda exp: exp.schema(), filters))
+
+    def __iter__(self):
+        return self._fire()
+
+    def _pages(self, params, limit=None, last_key=None):
+        ''' Send the request page by page and yield the raw responses,
+        until the results are exhausted or ``limit`` items are returned
+        '''
+        remaining = limit
+        while True:
+            page_params = dict(params)
+            page_size = self._max_page_size
+            if remaining is not None:
+                page_size = min(page_size or remaining, remaining)
+            if page_size:
+                page_params['Limit'] = page_size
+            if last_key:
+                page_params['ExclusiveStartKey'] = last_key
+
+            data = self._mapper.request(self._action, page_params)
+            yield data
+
+            if remaining is not None:
+                remaining -= data.get('Count', len(data.get('Items', [])))
+            last_key = data.get('LastEvaluatedKey')
+            if not last_key or remaining == 0:
+                return
+
+    def _items(self, pages):
+        return (item for data in pages for item in data.get('Items', []))
+
+    def _prefetch(self, pages, depth):
+        ''' Iterate ``pages`` on the metadata's executor, buffering up to
+        ``depth`` pages ahead of the consumer
+        '''
+        buffer = Queue(maxsize=depth)
+        stop = Event()
+
+        def produce():
+            error = None
+            try:
+                for data in pages:
+                    if stop.is_set():
+                        break
+                    _put(buffer, stop, data)
+            except Exception as e:
+                error = e
+            finally:
+                _put(buffer, stop, _Done(error))
+
+        self._mapper.metadata.executor.submit(produce)
+        try:
+            while True:
+                data = buffer.get()
+                if isinstance(data, _Done):
+                    if data.error is not None:
+                        raise data.error
+                    return
+                yield data
+        finally:
+            stop.set()
+
+    def filter(self, *args):
+        ''' filter on another keys
+        '''
+        assert not self._fired
+        for exp in args:
+            if not isinstance(exp, Expression):
+                raise ArgumentError("filter must be an Expression")
+            self._filters.append(exp)
+        return self
+
+    def limit(self, limit):
+        assert not self._fired
+        self._limit = limit
+        return self
+
+    def count(self):
+        ''' Count the results on the server side (``Select=COUNT``),
+        without transferring the items. The number of items evaluated
+        before the filters is kept in ``scanned_count``.
+        '''
+        assert not self._fired
+        self._fired = True
+        params = self._request_params()
+        params.pop('AttributesToGet', None)
+        params['Select'] = 'COUNT'
+
+        count = scanned = 0
+        for data in self._raw_pages(params):
+            count += data.get('Count', 0)
+            scanned += data.get('ScannedCount', 0)
+        if self._limit is not None:
+            count = min(count, self._limit)
+        self.scanned_count = scanned
+        return count
+
+    def all(self):
+        return list(self)
+
+    def first(self):
+        self = self.limit(1)
+        ret = list(self)
+        return ret[0] if ret else None
+
+
+class Query(_QueryBase):
+    _action = 'Query'
+
     def __init__(self, mapper, index=None,
                  attributes=None, consistent=False,
-                 max_page_size=None, reverse=False, limit=None):
+                 max_page_size=None, reverse=False, limit=None,
+                 deferred=False):
         self._mapper = mapper
 
         self._index = self._check_index(index)
         self._attributes = self._check_attributes(attributes)
+        self._deferred = self._check_deferred(deferred)
 
         if self._index:
             idx = getattr(self._mapper.class_, self._index)
@@ -32,6 +236,8 @@ class Query(object):
 
         self._key_conds = []
         self._filters = []
+        self._start_key = None
+        self.scanned_count = None
 
         self._fired = False
 
@@ -40,6 +246,7 @@ class Query(object):
         cloned._index = self._index
         if self._attributes:
             cloned._attributes = self._attributes[:]
+        cloned._deferred = self._deferred
         cloned._keyfields = self._keyfields[:]
         cloned._consistent = self._consistent
         cloned._max_page_size = self._max_page_size
@@ -47,6 +254,7 @@ class Query(object):
         cloned._limit = self._limit
         cloned._key_conds = self._key_conds[:]
         cloned._filters = self._filters[:]
+        cloned._start_key = self._start_key
         return cloned
 
     def _check_index(self, index):
@@ -60,40 +268,76 @@ class Query(object):
             return index
         raise ArgumentError("Unknown index `%s`" % index)
 
-    def _check_attributes(self, attrs):
-        if not attrs:
-            return None
-        else:
-            return [f.name for f in attrs]
-
-    def _build_raw_filters(self, filters):
-        return dict(map(lambda exp: exp.schema(), filters))
+    def _raw_pages(self, params):
+        return self._pages(params, self._limit, self._start_key)
 
     def _fire(self):
         self._fired = True
+        pages = self._raw_pages(self._request_params())
+        return self._wrap(self._items(pages))
 
-        query = self._mapper.table.query_2
+    def pages(self, prefetch=0):
+        ''' Iterate the results page by page, as :class:`Page` objects.
 
-        query_filter = self._build_raw_filters(self._filters)
-        filter_kwargs = self._build_raw_filters(self._key_conds)
+        ``page.cursor`` can be handed to a client and given to ``resume``
+        of a new identical query to continue after that page. With
+        ``prefetch``, the next pages (up to ``prefetch`` of them) are
+        fetched on the metadata's executor while the current one is
+        processed.
+        '''
+        self._fired = True
+        pages = self._raw_pages(self._request_params())
+        if prefetch:
+            pages = self._prefetch(pages, prefetch)
+        return self._wrap_pages(pages)
+
+    def _wrap_pages(self, pages):
+        for data in pages:
+            items = list(self._wrap(data.get('Items', [])))
+            yield Page(items, data.get('LastEvaluatedKey'),
+                       data.get('Count'), data.get('ScannedCount'))
+
+    def resume(self, cursor):
+        ''' Start after the page of ``cursor`` (see ``pages``)
+        '''
+        assert not self._fired
+        self._start_key = decode_cursor(cursor)
+        return self
+
+    def __aiter__(self):
+        from .aio import QueryIterator
+        return QueryIterator(self)
 
-        if not filter_kwargs:
+    def _request_params(self):
+        ''' The raw parameters of a DynamoDB Query request, without the
+        paging ones (``Limit`` and ``ExclusiveStartKey``)
+        '''
+        table = self._mapper.table
+
+        key_conds = self._build_raw_filters(self._key_conds)
+        if not key_conds:
             raise InvalidRequestError("Key Condition should be specified "
                                       "via the method `query.onkeys`")
 
-        results = query(limit=self._limit,
-                        index=self._index,
-                        reverse=self._reverse,
-                        consistent=self._consistent,
-                        attributes=self._attributes,
-                        max_page_size=self._max_page_size,
-                        query_filter=query_filter,
-                        conditional_operator=None,
-                        **filter_kwargs)
-        return self._mapper.wrap_result(results)
-
-    def __iter__(self):
-        return self._fire()
+        params = {
+            'TableName': self._mapper.tablename,
+            'KeyConditions': table._build_filters(
+                key_conds, using=dynamo.QUERY_OPERATORS),
+        }
+        query_filter = self._build_raw_filters(self._filters)
+        if query_filter:
+            params['QueryFilter'] = table._build_filters(
+                query_filter, using=dynamo.FILTER_OPERATORS)
+        if self._index:
+            params['IndexName'] = self._index
+        if self._consistent:
+            params['ConsistentRead'] = True
+        if self._attributes:
+            params['AttributesToGet'] = self._attributes
+            params['Select'] = 'SPECIFIC_ATTRIBUTES'
+        if self._reverse:
+            params['ScanIndexForward'] = False
+        return params
 
     def onkeys(self, hashkey_cond, rangekey_cond=None):
         ''' Specify KeyConditionExpression
@@ -131,16 +375,6 @@ class Query(object):
 
         return self
 
-    def filter(self, *args):
-        ''' filter on another keys
-        '''
-        assert not self._fired
-        for exp in args:
-            if not isinstance(exp, Expression):
-                raise ArgumentError("filter must be an Expression")
-            self._filters.append(exp)
-        return self
-
     def asc(self):
         assert not self._fired
         self._reverse = False
@@ -151,19 +385,91 @@ class Query(object):
         self._reverse = True
         return self
 
-    def limit(self, limit):
-        assert not self._fired
+
+class Scan(_QueryBase):
+    ''' Scan the whole table, optionally in parallel segments.
+
+    With ``segments`` greater than 1, every segment is scanned on the
+    metadata's executor and the items are yielded as soon as their pages
+    arrive, so the order of the results is not defined.
+    '''
+    _action = 'Scan'
+
+    def __init__(self, mapper, attributes=None, segments=None,
+                 max_page_size=None, limit=None, deferred=False):
+        self._mapper = mapper
+        self._attributes = self._check_attributes(attributes)
+        self._deferred = self._check_deferred(deferred)
+        if segments is not None and segments < 1:
+            raise ArgumentError("segments should be a positive integer")
+        self._segments = segments
+        self._max_page_size = max_page_size
         self._limit = limit
-        return self
 
-    def count(self):
-        assert not self._fired
-        return len(list(self))
+        self._filters = []
+        self.scanned_count = None
 
-    def all(self):
-        return list(self)
+        self._fired = False
 
-    def first(self):
-        self = self.limit(1)
-        ret = list(self)
-        return ret[0] if ret else None
+    def _request_params(self):
+        ''' The raw parameters of a DynamoDB Scan request, without the
+        paging and segment ones
+        '''
+        params = {'TableName': self._mapper.tablename}
+        scan_filter = self._build_raw_filters(self._filters)
+        if scan_filter:
+            params['ScanFilter'] = self._mapper.table._build_filters(
+                scan_filter, using=dynamo.FILTER_OPERATORS)
+        if self._attributes:
+            params['AttributesToGet'] = self._attributes
+            params['Select'] = 'SPECIFIC_ATTRIBUTES'
+        return params
+
+    def _raw_pages(self, params):
+        if not self._segments or self._segments == 1:
+            return self._pages(params, self._limit)
+        return self._scan_segments(params)
+
+    def _fire(self):
+        self._fired = True
+
+        results = self._items(self._raw_pages(self._request_params()))
+        if self._segments and self._segments > 1 and self._limit is not None:
+            results = islice(results, self._limit)
+        return self._wrap(results)
+
+    def _scan_segments(self, params):
+        total = self._segments
+        pages = Queue(maxsize=total * 2)
+        stop = Event()
+
+        def scan_segment(segment):
+            error = None
+            try:
+                segment_params = dict(params, Segment=segment,
+                                      TotalSegments=total)
+                for data in self._pages(segment_params):
+                    if stop.is_set():
+                        break
+                    _put(pages, stop, data)
+            except Exception as e:
+                error = e
+            finally:
+                _put(pages, stop, _Done(error))
+
+        executor = self._mapper.metadata.executor
+        for segment in range(total):
+            executor.submit(scan_segment, segment)
+
+        try:
+            done = 0
+            while done < total:
+                page = pages.get()
+                if isinstance(page, _Done):
+                    if page.error is not None:
+                        raise page.error
+                    done += 1
+                else:
+                    yield page
+        finally:
+            stop.set()
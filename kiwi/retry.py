@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+'''
+Retry helpers for unprocessed keys/items and throttled requests
+'''
+
+import random
+import time
+
+
+def backoff_delay(attempt, base=0.05, cap=5.0):
+    ''' "Full jitter" exponential backoff: a random delay in
+    ``[0, min(cap, base * 2 ** attempt)]`` seconds.
+    '''
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def backoff(attempt, base=0.05, cap=5.0):
+    ''' Sleep before retry ``attempt`` (no sleep for the first try)
+    '''
+    if attempt > 0:
+        time.sleep(backoff_delay(attempt, base, cap))
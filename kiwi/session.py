@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+'''
+Identity map: one live object per primary key within a session
+'''
+
+from builtins import object
+
+__all__ = ['IdentityMap']
+
+from collections import OrderedDict
+from threading import RLock
+
+from .exceptions import *
+
+
+class IdentityMap(object):
+    ''' A bounded LRU map of ``(tablename, primary key) -> object``.
+
+    Objects are looked up and registered by :class:`~kiwi.mapper.Mapper`,
+    so ``get``, ``batch_get`` and query iteration return the same instance
+    for the same primary key while the map is active.
+    '''
+    def __init__(self, maxsize=1000):
+        if maxsize is not None and maxsize <= 0:
+            raise ArgumentError("maxsize must be a positive integer")
+        self.maxsize = maxsize
+        self._objs = OrderedDict()
+        self._lock = RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            obj = self._objs.pop(key, None)
+            if obj is None:
+                return default
+            self._objs[key] = obj
+            return obj
+
+    def add(self, key, obj):
+        with self._lock:
+            self._objs.pop(key, None)
+            self._objs[key] = obj
+            if self.maxsize is not None:
+                while len(self._objs) > self.maxsize:
+                    self._objs.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._objs.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._objs.clear()
+
+    def __contains__(self, key):
+        return key in self._objs
+
+    def __len__(self):
+        return len(self._objs)
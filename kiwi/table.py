@@ -6,8 +6,8 @@ from future.utils import with_metaclass
 __all__ = ['TableMeta', 'TableBase', 'Table']
 
 from .mapper import setup_mapping
-from .query import Query
-from .batch import BatchWrite
+from .query import Query, Scan
+from .batch import BatchWrite, BackgroundBatchWrite
 
 
 def is_table(cls):
@@ -41,17 +41,33 @@ class TableMeta(type):
     def get(tbl, *args):
         ''' Get item by primary key
         '''
-        item = tbl.__mapper__.get_item(*args)
-        if item is not None:
-            return tbl(_item=item)
-        else:
-            return None
+        return tbl.__mapper__.get(*args)
+
+    def batch_get(tbl, keys, ordered=False):
+        return tbl.__mapper__.batch_get(keys, ordered=ordered)
 
-    def batch_get(tbl, keys):
-        return tbl.__mapper__.batch_get(keys)
+    def aget(tbl, *args):
+        ''' Coroutine version of ``get``, see :mod:`kiwi.aio`
+        '''
+        from .aio import get
+        return get(tbl.__mapper__, *args)
 
-    def batch_write(tbl):
-        return BatchWrite(tbl.__mapper__)
+    def abatch_get(tbl, keys, ordered=False):
+        ''' Coroutine version of ``batch_get``, see :mod:`kiwi.aio`
+        '''
+        from .aio import batch_get
+        return batch_get(tbl.__mapper__, keys, ordered=ordered)
+
+    def batch_write(tbl, async_flush=False, workers=None, queue_size=None,
+                    buffer_size=None):
+        ''' A batch writer, see :class:`~kiwi.batch.BatchWrite`. With
+        ``async_flush``, the writes are sent by background threads, see
+        :class:`~kiwi.batch.BackgroundBatchWrite`
+        '''
+        if async_flush:
+            return BackgroundBatchWrite(tbl.__mapper__, workers=workers,
+                                        queue_size=queue_size)
+        return BatchWrite(tbl.__mapper__, buffer_size=buffer_size)
 
     def delete(tbl, **kwargs):
         return tbl.__mapper__.delete_item(**kwargs)
@@ -59,24 +75,51 @@ class TableMeta(type):
     def query(tbl, **kwargs):
         return Query(tbl.__mapper__, **kwargs)
 
+    def scan(tbl, **kwargs):
+        ''' Scan the whole table, see :class:`~kiwi.query.Scan`
+        '''
+        return Scan(tbl.__mapper__, **kwargs)
+
 
 class TableBase(object):
     ''' Basic Item API
     '''
+    __slots__ = ('_values', '_extra', '_orig', '_persisted', '_deferred')
+
     def __init__(self, _item=None, **kwargs):
-        self._item = self.__mapper__.new_item(_item, **kwargs)
+        if _item is not None:
+            self.__mapper__.init_instance(self, _item, persisted=True)
+        else:
+            self.__mapper__.init_instance(self, kwargs)
 
     def save(self, overwrite=False):
-        assert hasattr(self, '_item')
-        self._item.save(overwrite)
+        ''' Save the object.
+
+        A new object is written as a whole (PutItem). An object loaded from
+        dynamodb only sends the fields assigned since it was loaded or last
+        saved (UpdateItem), removing the ones cleared to None. Mutating a
+        value in place (e.g. adding to a set) is not tracked: assign it
+        back to the field.
+        '''
+        mapper = self.__mapper__
+        request = mapper.save_request(self, overwrite)
+        if request is not None:
+            mapper.request(*request)
+        mapper.saved(self)
+
+    def asave(self, overwrite=False):
+        ''' Coroutine version of ``save``, see :mod:`kiwi.aio`
+        '''
+        from .aio import save
+        return save(self, overwrite)
 
     def destroySelf(self):
-        assert hasattr(self, '_item')
-        self._item.delete()
+        mapper = self.__mapper__
+        mapper.delete_item(**dict((k.name, getattr(self, k.name))
+                                  for k in mapper.schema))
 
     def items(self):
-        assert hasattr(self, '_item')
-        return self._item.items()
+        return list(self.__mapper__.iter_items(self))
 
 
 class Table(with_metaclass(TableMeta, TableBase)):
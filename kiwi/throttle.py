@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+'''
+Client side rate limiting against the provisioned throughput
+'''
+
+from builtins import object
+
+__all__ = ['TokenBucket', 'CapacityLimiter']
+
+import time
+from threading import Lock
+
+from . import dynamo
+from .exceptions import *
+
+
+ACTION_KINDS = {
+    'GetItem': 'read',
+    'Query': 'read',
+    'Scan': 'read',
+    'BatchGetItem': 'read',
+    'PutItem': 'write',
+    'UpdateItem': 'write',
+    'DeleteItem': 'write',
+    'BatchWriteItem': 'write',
+}
+
+
+class TokenBucket(object):
+    ''' A token bucket of capacity units.
+
+    Callers ``wait`` until the bucket is not in debt, then ``consume`` the
+    units really spent (as reported by ``ConsumedCapacity``), which may
+    put the bucket in debt. ``throttled`` halves the refill rate, which
+    then recovers a little on every consume.
+    '''
+    MIN_FACTOR = 0.1
+    RECOVERY = 0.02
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ArgumentError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self._tokens = self.burst
+        self._factor = 1.0
+        self._last = time.time()
+        self._lock = Lock()
+
+    def _refill(self):
+        now = time.time()
+        rate = self.rate * self._factor
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._last) * rate)
+        self._last = now
+
+    def wait(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens > 0:
+                    return
+                delay = -self._tokens / (self.rate * self._factor)
+            time.sleep(delay + 0.001)
+
+    def consume(self, units):
+        with self._lock:
+            self._refill()
+            self._tokens -= units
+            self._factor = min(1.0, self._factor + self.RECOVERY)
+
+    def throttled(self):
+        with self._lock:
+            self._refill()
+            self._factor = max(self.MIN_FACTOR, self._factor / 2)
+            self._tokens = min(self._tokens, 0)
+
+    @property
+    def tokens(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class CapacityLimiter(object):
+    ''' Keep the requests of a metadata below ``ratio`` of the provisioned
+    throughput, with one read and one write bucket per table and per
+    global index. Tables or indexes without a declared throughput are
+    not limited.
+    '''
+    def __init__(self, ratio=1.0, burst=1.0):
+        if ratio <= 0:
+            raise ArgumentError("ratio must be positive")
+        self.ratio = ratio
+        self.burst = burst
+        self._buckets = {}
+        self._lock = Lock()
+
+    def bucket(self, metadata, tablename, index, kind):
+        ''' The bucket of ``kind`` ('read' or 'write') of a table, or of
+        one of its global indexes. None if unlimited.
+        '''
+        key = (tablename, index, kind)
+        try:
+            return self._buckets[key]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = self._build_bucket(
+                    metadata, tablename, index, kind)
+            return self._buckets[key]
+
+    def _build_bucket(self, metadata, tablename, index, kind):
+        mapper = metadata.get_mapper(tablename)
+        if mapper is None:
+            return None
+        throughput = mapper.throughput
+        if index is not None:
+            throughput = mapper.global_indexes[index].throughput
+        if not throughput or not throughput.get(kind):
+            return None
+        rate = throughput[kind] * self.ratio
+        return TokenBucket(rate, rate * self.burst)
+
+    def request(self, metadata, connection, action, params):
+        ''' Send a raw request once the buckets it touches are not in
+        debt, asking for ``ReturnConsumedCapacity`` and consuming what is
+        reported. Actions other than data operations are not limited.
+        '''
+        kind = ACTION_KINDS.get(action)
+        if kind is None:
+            return dynamo.make_request(connection, action, params)
+
+        if 'RequestItems' in params:
+            requests = [(name, None) for name in params['RequestItems']]
+        else:
+            requests = [(params['TableName'], params.get('IndexName'))]
+        buckets = {}
+        for tablename, index in requests:
+            for name, bucket in self._touched(metadata, tablename, index,
+                                              kind).items():
+                buckets[(tablename, name)] = bucket
+        for bucket in buckets.values():
+            bucket.wait()
+
+        params = dict(params, ReturnConsumedCapacity='INDEXES')
+        events = getattr(connection, 'throughput_exceeded_events', 0)
+        try:
+            ret = dynamo.make_request(connection, action, params)
+        except dynamo.ProvisionedThroughputExceededException:
+            for bucket in buckets.values():
+                bucket.throttled()
+            raise
+
+        if getattr(connection, 'throughput_exceeded_events', 0) != events:
+            for bucket in buckets.values():
+                bucket.throttled()
+        self._consume(ret.get('ConsumedCapacity'), buckets)
+        return ret
+
+    def _touched(self, metadata, tablename, index, kind):
+        mapper = metadata.get_mapper(tablename)
+        buckets = {}
+        if index is not None and mapper is not None and \
+                index in mapper.global_indexes:
+            buckets[index] = self.bucket(metadata, tablename, index, kind)
+        else:
+            buckets[None] = self.bucket(metadata, tablename, None, kind)
+            if kind == 'write' and mapper is not None:
+                # writes are propagated to every global index
+                for name in mapper.global_indexes:
+                    buckets[name] = self.bucket(metadata, tablename,
+                                                name, kind)
+        return dict((k, v) for k, v in buckets.items() if v is not None)
+
+    def _consume(self, consumed, buckets):
+        if not consumed:
+            return
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        for cc in consumed:
+            tablename = cc.get('TableName')
+            gsis = cc.get('GlobalSecondaryIndexes') or {}
+            lsis = cc.get('LocalSecondaryIndexes') or {}
+            if 'Table' in cc:
+                units = cc['Table'].get('CapacityUnits', 0)
+            elif gsis:
+                units = 0
+            else:
+                units = cc.get('CapacityUnits', 0)
+            for idx in lsis.values():
+                units += idx.get('CapacityUnits', 0)
+
+            bucket = buckets.get((tablename, None))
+            if bucket is not None and units:
+                bucket.consume(units)
+            for name, idx in gsis.items():
+                bucket = buckets.get((tablename, name))
+                if bucket is not None:
+                    bucket.consume(idx.get('CapacityUnits', 0))
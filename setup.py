@@ -22,5 +22,7 @@ setup(name='kiwi',
       description='Simple dynamodb ORM',
       author='Papaya Backend',
       author_email='backend@papayamobile.com',
-      install_requires=['future', 'boto>=2.38.0'],
+      install_requires=['future', 'boto>=2.38.0',
+                        'futures; python_version < "3"'],
+      extras_require={'aio': ['aiohttp']},
       )
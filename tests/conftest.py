@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import pytest
+import sys
 import time
 
 from boto.dynamodb2.types import NUMBER
@@ -10,6 +11,11 @@ from kiwi import Field, HashKeyField, RangeKeyField
 from kiwi import LocalAllIndex, GlobalAllIndex
 
 
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append('test_aio.py')
+
+
 @pytest.fixture(scope="session")
 def local_db():
     from boto.dynamodb2.layer1 import DynamoDBConnection
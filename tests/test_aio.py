@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from kiwi import *
+
+
+def run(metadata, coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await metadata.async_engine.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+
+class TestAsync(object):
+    def test_get(self, metadata, User):
+        u = run(metadata, User.aget(1))
+        assert isinstance(u, User)
+        assert u.id == 1
+        assert u.name == 'a'
+
+        assert run(metadata, User.aget(404)) is None
+
+        with pytest.raises(ArgumentError):
+            run(metadata, User.aget(1, 2))
+
+    def test_batch_get(self, metadata, User):
+        users = run(metadata, User.abatch_get([3, 404, 1], ordered=True))
+        assert [u and u.id for u in users] == [3, None, 1]
+
+        users = run(metadata, User.abatch_get([1, 2, 404]))
+        assert set(u.id for u in users) == set([1, 2])
+
+    def test_query(self, metadata, UserAction):
+        async def collect(query):
+            uas = []
+            async for ua in query:
+                uas.append(ua)
+            return uas
+
+        query = UserAction.query(max_page_size=1).onkeys(UserAction.id == 2)
+        uas = run(metadata, collect(query))
+        assert [ua.time for ua in uas] == [2, 3, 9, 10]
+
+        query = UserAction.query().onkeys(UserAction.id == 2).desc().limit(3)
+        uas = run(metadata, collect(query))
+        assert [ua.time for ua in uas] == [10, 9, 3]
+
+        query = UserAction.query().onkeys(UserAction.id == 2)
+        query.filter(UserAction.duration < 2)
+        uas = run(metadata, collect(query))
+        assert [ua.time for ua in uas] == [3, 9]
+
+        with pytest.raises(InvalidRequestError):
+            run(metadata, collect(UserAction.query()))
+
+    def test_save(self, metadata, User):
+        u = User(id=40, name='40')
+        run(metadata, u.asave())
+        assert User.get(40).name == '40'
+
+        u.name = 'forty'
+        run(metadata, u.asave())
+        assert User.get(40).name == 'forty'
+
+        u = User.get(40)
+        u.name = None
+        run(metadata, u.asave())
+        assert User.get(40).name is None
+
+        User.delete(id=40)
@@ -4,9 +4,11 @@ from builtins import object
 
 import pytest
 
+from kiwi import MetaData, Table
 from kiwi.field import *
 from kiwi.exceptions import *
 from kiwi import dynamo
+from boto.dynamodb2.types import NUMBER
 
 
 class TestField(object):
@@ -26,23 +28,41 @@ class TestField(object):
         assert rf.attr_type is dynamo.RangeKey
 
     def test_descriptor(self):
-        class Owner(object):
+        class Owner(Table):
+            __metadata__ = MetaData()
+            id = HashKeyField()
             f = Field('f')
-            def __init__(self):
-                self._item = {}
-        Owner.f.owner = Owner
 
-        owner = Owner()
+        owner = Owner(id='a')
         assert owner.f is None
         owner.f = 3
         assert owner.f == 3
         owner.f = 5
         assert owner.f == 5
-        assert owner._item['f'] == 5
+        assert dict(owner.items()) == {'id': 'a', 'f': 5}
 
         with pytest.raises(InvalidRequestError):
             del owner.f
 
+    def test_loaded(self):
+        class Loaded(Table):
+            __metadata__ = MetaData()
+            id = HashKeyField()
+            f = Field(data_type=NUMBER, default=7)
+
+        mapper = Loaded.__mapper__
+        obj = mapper.load({'id': {'S': 'a'}, 'x': {'S': 'extra'}})
+        assert obj._orig is None
+        assert obj.f == 7
+        assert obj._orig is None
+        assert dict(obj.items()) == {'id': 'a', 'f': 7, 'x': 'extra'}
+
+        obj.f = 8
+        obj.f = 9
+        assert obj._orig == {'f': 7}
+        assert mapper.dump(obj) == {'id': {'S': 'a'}, 'f': {'N': '9'},
+                                    'x': {'S': 'extra'}}
+
     def test_expression(self):
         f = Field('f')
 
@@ -198,6 +198,50 @@ class TestQuery(object):
         query = query.clone().limit(1)
         assert query.count() == 1
 
+    def test_count(self, UserAction, monkeypatch):
+        def load(item):
+            raise AssertionError("items should not be loaded")
+        monkeypatch.setattr(UserAction.__mapper__, 'load', load)
+
+        query = UserAction.query().onkeys(UserAction.id == 2)
+        assert query.count() == 4
+        assert query.scanned_count == 4
+
+        query = UserAction.query().onkeys(UserAction.id == 2) \
+                          .filter(UserAction.result == 'ko')
+        assert query.count() == 1
+        assert query.scanned_count == 4
+
+        query = UserAction.query(limit=3).onkeys(UserAction.id == 2)
+        assert query.count() == 3
+
+    def test_deferred(self, UserAction, monkeypatch):
+        mapper = UserAction.__mapper__
+        orig = mapper.request
+        actions = []
+
+        def request(action, params):
+            actions.append(action)
+            return orig(action, params)
+        monkeypatch.setattr(mapper, 'request', request)
+
+        query = UserAction.query(attributes=[UserAction.name],
+                                 deferred=True, max_page_size=10)
+        uas = query.onkeys(UserAction.id == 2).all()
+        assert len(uas) == 4
+        assert all(ua.name for ua in uas)
+        uas[0].result = 'assigned'
+        assert actions == ['Query']
+
+        assert uas[1].duration == 1
+        assert actions == ['Query', 'BatchGetItem']
+        assert [ua.duration for ua in uas] == [5, 1, 1, 2]
+        assert uas[0].result == 'assigned'
+        assert actions == ['Query', 'BatchGetItem']
+
+        with pytest.raises(ArgumentError):
+            UserAction.query(deferred=True)
+
     def test_first(self, UserAction):
         query = UserAction.query().onkeys(UserAction.id == 2)
         ua = query.first()
@@ -206,3 +250,76 @@ class TestQuery(object):
         query = query.clone().desc()
         ua = query.first()
         assert ua.time == 10
+
+    def test_pages(self, UserAction):
+        query = UserAction.query(max_page_size=2).onkeys(UserAction.id == 2)
+        pages = list(query.pages())
+        assert [[ua.time for ua in page] for page in pages][:2] == \
+            [[2, 3], [9, 10]]
+        assert [ua.time for page in pages for ua in page] == [2, 3, 9, 10]
+        assert pages[0].cursor is not None
+        assert pages[0].count == len(pages[0])
+
+        cursor = pages[0].cursor
+        query = UserAction.query(max_page_size=2).onkeys(UserAction.id == 2)
+        assert [ua.time for ua in query.resume(cursor)] == [9, 10]
+
+        query = UserAction.query(limit=3).onkeys(UserAction.id == 2)
+        assert [ua.time for page in query.pages() for ua in page] == \
+            [2, 3, 9]
+
+        with pytest.raises(ArgumentError):
+            UserAction.query().resume('not a cursor')
+
+    def test_pages_prefetch(self, UserAction):
+        query = UserAction.query(max_page_size=1).onkeys(UserAction.id == 2)
+        pages = list(query.pages(prefetch=2))
+        assert [ua.time for page in pages for ua in page] == [2, 3, 9, 10]
+
+        query = UserAction.query(max_page_size=1).onkeys(UserAction.id == 2)
+        for page in query.pages(prefetch=1):
+            break
+        assert [ua.time for ua in page] == [2]
+
+
+class TestScan(object):
+    def test_basic(self, UserAction):
+        uas = UserAction.scan().all()
+        assert len(uas) == 13
+        assert all(isinstance(ua, UserAction) for ua in uas)
+
+    def test_filter(self, UserAction):
+        scan = UserAction.scan().filter(UserAction.result == 'ok')
+        assert set(ua.time for ua in scan) == set([1, 3, 5, 6, 8, 12])
+
+        with pytest.raises(ArgumentError):
+            UserAction.scan().filter(3)
+
+    def test_attributes(self, UserAction):
+        scan = UserAction.scan(attributes=[UserAction.id, UserAction.time])
+        for ua in scan:
+            assert ua.name is None
+
+    def test_limit(self, UserAction):
+        assert len(UserAction.scan(limit=4).all()) == 4
+        assert len(UserAction.scan(segments=3).limit(5).all()) == 5
+        assert UserAction.scan().first() is not None
+
+    def test_count(self, UserAction):
+        assert UserAction.scan().count() == 13
+        scan = UserAction.scan(segments=3).filter(UserAction.result == 'ok')
+        assert scan.count() == 6
+        assert scan.scanned_count == 13
+        assert UserAction.scan(limit=4).count() == 4
+
+    def test_segments(self, UserAction):
+        keys = set((ua.id, ua.time) for ua in UserAction.scan())
+        for segments in (2, 3, 20):
+            scan = UserAction.scan(segments=segments, max_page_size=2)
+            assert set((ua.id, ua.time) for ua in scan) == keys
+
+        scan = UserAction.scan(segments=4).filter(UserAction.duration > 3)
+        assert set(ua.time for ua in scan) == set([2, 4, 7])
+
+        with pytest.raises(ArgumentError):
+            UserAction.scan(segments=0)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+from builtins import object
+
+import pytest
+
+from kiwi import *
+from kiwi.session import IdentityMap
+
+
+class TestIdentityMap(object):
+    def test_lru(self):
+        imap = IdentityMap(maxsize=2)
+        imap.add('a', 1)
+        imap.add('b', 2)
+        assert imap.get('a') == 1
+        imap.add('c', 3)
+        assert 'a' in imap
+        assert 'b' not in imap
+        assert 'c' in imap
+        assert len(imap) == 2
+
+        imap.discard('a')
+        assert imap.get('a') is None
+        imap.clear()
+        assert len(imap) == 0
+
+    def test_maxsize(self):
+        with pytest.raises(ArgumentError):
+            IdentityMap(maxsize=0)
+
+
+class TestSession(object):
+    def test_scope(self, metadata, User):
+        assert metadata.identity_map is None
+        with metadata.session() as imap:
+            assert metadata.identity_map is imap
+            with metadata.session() as inner:
+                assert metadata.identity_map is inner
+            assert metadata.identity_map is imap
+        assert metadata.identity_map is None
+
+        assert User.get(1) is not User.get(1)
+
+    def test_get(self, metadata, User):
+        with metadata.session():
+            u = User.get(1)
+            assert u is User.get(1)
+            assert User.get(404) is None
+
+    def test_batch_get_and_query(self, metadata, User, UserAction):
+        with metadata.session():
+            u = User.get(2)
+            users = list(User.batch_get([1, 2, 3]))
+            assert set(x.id for x in users) == set([1, 2, 3])
+            assert u in users
+
+            ua = UserAction.get(2, 3)
+            found = UserAction.query().onkeys(UserAction.id == 2).all()
+            assert ua in found
+
+    def test_write_coherence(self, metadata, User):
+        with metadata.session():
+            u = User(id=300, name='300')
+            u.save()
+            assert User.get(300) is u
+
+            u.destroySelf()
+            assert User.get(300) is None
+
+            User(id=301, name='301').save()
+            User.delete(id=301)
+            assert User.get(301) is None
+
+            with User.batch_write() as batch:
+                v = User(id=302, name='302')
+                batch.add(v)
+            assert User.get(302) is v
+
+            with User.batch_write() as batch:
+                batch.delete(v)
+            assert User.get(302) is None
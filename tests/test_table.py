@@ -4,9 +4,11 @@ from builtins import zip
 from builtins import range
 from builtins import object
 
+import json
 import pytest
 
 from kiwi import *
+from kiwi import dynamo
 from boto.dynamodb2.types import *
 
 
@@ -53,6 +55,68 @@ class TestTable(object):
         u = UserAction.get(11, 1111)
         assert u is None
 
+    def test_partial_save(self, User, monkeypatch):
+        conn = User.__mapper__.table.connection
+        orig = conn.make_request
+        calls = []
+
+        def make_request(action, body):
+            if action in ('PutItem', 'UpdateItem'):
+                calls.append((action, json.loads(body)))
+            return orig(action, body)
+        monkeypatch.setattr(conn, 'make_request', make_request)
+
+        u = User(id=30, name='30', birth=30)
+        u.save()
+        assert calls[-1][0] == 'PutItem'
+
+        u.name = 'thirty'
+        u.save()
+        action, params = calls[-1]
+        assert action == 'UpdateItem'
+        assert set(params['AttributeUpdates']) == set(['name'])
+        assert params['AttributeUpdates']['name']['Action'] == 'PUT'
+
+        del calls[:]
+        u.save()
+        assert calls == []
+
+        u = User.get(30)
+        assert u.name == 'thirty'
+        assert u.birth == 30
+        u.name = None
+        u.save()
+        action, params = calls[-1]
+        assert action == 'UpdateItem'
+        assert params['AttributeUpdates'] == {'name': {'Action': 'DELETE'}}
+
+        u = User.get(30)
+        assert u.name is None
+        assert u.birth == 30
+
+        u.id = 31
+        u.save(overwrite=True)
+        assert calls[-1][0] == 'PutItem'
+        assert User.get(31).birth == 30
+
+        User.delete(id=30)
+        User.delete(id=31)
+
+    def test_partial_save_conflict(self, User):
+        User(id=32, name='32').save()
+        u1 = User.get(32)
+        u2 = User.get(32)
+
+        u1.name = 'u1'
+        u1.save()
+        u2.name = 'u2'
+        with pytest.raises(dynamo.JSONResponseError):
+            u2.save()
+        u2.save(overwrite=True)
+        assert User.get(32).name == 'u2'
+
+        User.delete(id=32)
+
     def test_default_value(self, User):
         u = User(id=20, name='20default')
         birth = u.birth
@@ -96,6 +160,45 @@ class TestTable(object):
         with pytest.raises(ArgumentError):
             UserAction.batch_get([2, 2])
 
+    def test_batch_get_ordered(self, User):
+        users = User.batch_get([3, 404, 1, 3], ordered=True)
+        assert [u and u.id for u in users] == [3, None, 1, 3]
+        assert users[0] is users[3]
+
+        assert User.batch_get([], ordered=True) == []
+
+    def test_batch_get_chunks(self, User, monkeypatch):
+        from kiwi import mapper
+        monkeypatch.setattr(mapper, 'BATCH_GET_SIZE', 2)
+
+        keys = list(range(1, 10)) + [404]
+        users = User.batch_get(keys, ordered=True)
+        assert [u and u.id for u in users] == list(range(1, 10)) + [None]
+        assert set(u.id for u in User.batch_get(keys)) == set(range(1, 10))
+
+    def test_batch_get_unprocessed(self, User, monkeypatch):
+        conn = User.__mapper__.table.connection
+        orig = conn.make_request
+        calls = []
+
+        def make_request(action, body):
+            if action != 'BatchGetItem':
+                return orig(action, body)
+            params = json.loads(body)
+            keys = params['RequestItems']['user']['Keys']
+            calls.append(keys)
+            if len(calls) == 1:
+                params['RequestItems']['user']['Keys'] = keys[:1]
+                ret = orig(action, json.dumps(params))
+                ret['UnprocessedKeys'] = {'user': {'Keys': keys[1:]}}
+                return ret
+            return orig(action, body)
+        monkeypatch.setattr(conn, 'make_request', make_request)
+
+        users = User.batch_get([1, 2, 3], ordered=True)
+        assert [u.id for u in users] == [1, 2, 3]
+        assert len(calls) == 2
+
     def test_batch_write_1(self, User):
         with User.batch_write() as batch:
             pass
@@ -132,6 +235,76 @@ class TestTable(object):
         User.delete(id=100)
         assert set([u.id for u in User.batch_get(keys)]) == set()
 
+    def test_batch_write_coalesce(self, User, monkeypatch):
+        mapper = User.__mapper__
+        orig = mapper.request
+        writes = []
+
+        def request(action, params):
+            if action == 'BatchWriteItem':
+                writes.append(params['RequestItems']['user'])
+            return orig(action, params)
+        monkeypatch.setattr(mapper, 'request', request)
+
+        with User.batch_write() as batch:
+            batch.add(User(id=110, name='a'))
+            batch.add(User(id=110, name='b'))
+            batch.add(User(id=111, name='a'))
+            batch.delete({'id': 111})
+            batch.add(User(id=112, name='a'))
+            batch.delete({'id': 112})
+            batch.add(User(id=112, name='c'))
+        assert len(writes) == 1
+        assert len(writes[0]) == 3
+        assert User.get(110).name == 'b'
+        assert User.get(111) is None
+        assert User.get(112).name == 'c'
+
+        del writes[:]
+        with User.batch_write(buffer_size=100) as batch:
+            for i in range(60):
+                batch.add(User(id=110 + i % 30, name=str(i)))
+        assert [len(w) for w in writes] == [25, 5]
+        assert User.get(110).name == '30'
+
+        with User.batch_write(async_flush=True, workers=1) as batch:
+            futures = [batch.add(User(id=110, name=str(i)))
+                       for i in range(10)]
+            futures.append(batch.delete({'id': 110}))
+        assert all(f.done() and f.exception() is None for f in futures)
+        assert User.get(110) is None
+
+        with User.batch_write() as batch:
+            for i in range(30):
+                batch.delete({'id': 110 + i})
+
+    def test_batch_write_background(self, User):
+        keys = list(range(200, 260))
+        with User.batch_write(async_flush=True, workers=3) as batch:
+            futures = [batch.add(User(id=k, name=str(k))) for k in keys]
+            batch.flush()
+            assert all(f.done() and f.exception() is None for f in futures)
+            assert set(u.id for u in User.batch_get(keys)) == set(keys)
+
+            futures = [batch.delete({'id': k}) for k in keys]
+        assert all(f.done() for f in futures)
+        assert list(User.batch_get(keys)) == []
+
+    def test_batch_write_background_error(self, User, monkeypatch):
+        mapper = User.__mapper__
+
+        def request(action, params):
+            raise dynamo.ValidationException(400, 'Bad Request')
+        monkeypatch.setattr(mapper, 'request', request)
+
+        batch = User.batch_write(async_flush=True, workers=2)
+        future = batch.add(User(id=300, name='300'))
+        with pytest.raises(dynamo.ValidationException):
+            batch.flush()
+        assert isinstance(future.exception(), dynamo.ValidationException)
+        batch.flush()
+        batch.close()
+
     def test_batch_write_2(self, UserAction):
         UA = UserAction
 
@@ -172,3 +345,66 @@ class TestTable(object):
 
         UA.delete(id=100, time=100)
         assert set([(u.id, u.time) for u in UA.batch_get(keys)]) == set()
+
+
+class TestMultiTable(object):
+    def test_batch_get(self, metadata, User, UserAction, monkeypatch):
+        orig = metadata.request
+        calls = []
+
+        def request(action, params, connection=None):
+            calls.append(action)
+            return orig(action, params, connection)
+        monkeypatch.setattr(metadata, 'request', request)
+
+        results = metadata.batch_get({
+            User: [3, 404, 1],
+            UserAction: [(2, 3), (1, 1)],
+        }, ordered=True)
+        assert calls == ['BatchGetItem']
+        assert [u and u.id for u in results[User]] == [3, None, 1]
+        assert [(ua.id, ua.time) for ua in results[UserAction]] == \
+            [(2, 3), (1, 1)]
+
+        results = metadata.batch_get({User: [1, 2], UserAction: []})
+        assert set(u.id for u in results[User]) == set([1, 2])
+        assert results[UserAction] == []
+
+        with pytest.raises(ArgumentError):
+            metadata.batch_get({object: [1]})
+
+    def test_batch_get_chunks(self, metadata, User, UserAction, monkeypatch):
+        from kiwi import mapper
+        monkeypatch.setattr(mapper, 'BATCH_GET_SIZE', 2)
+
+        results = metadata.batch_get({
+            User: list(range(1, 6)),
+            UserAction: [(1, 1), (2, 2), (2, 3)],
+        }, ordered=True)
+        assert [u.id for u in results[User]] == list(range(1, 6))
+        assert len(results[UserAction]) == 3
+
+    def test_batch_write(self, metadata, User, UserAction, monkeypatch):
+        orig = metadata.request
+        calls = []
+
+        def request(action, params, connection=None):
+            calls.append((action, sorted(params.get('RequestItems', {}))))
+            return orig(action, params, connection)
+        monkeypatch.setattr(metadata, 'request', request)
+
+        with metadata.batch_write() as batch:
+            batch.add(User(id=120, name='120'))
+            batch.add(UserAction(id=120, time=1, name='120'))
+            batch.delete({'id': 121}, table=User)
+            with pytest.raises(ArgumentError):
+                batch.add(123)
+        assert calls == [('BatchWriteItem', ['user', 'user_action'])]
+        assert User.get(120).name == '120'
+        assert UserAction.get(120, 1).name == '120'
+
+        with metadata.batch_write() as batch:
+            batch.delete(User.get(120))
+            batch.delete(UserAction(id=120, time=1))
+        assert User.get(120) is None
+        assert UserAction.get(120, 1) is None
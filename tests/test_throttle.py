@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+from builtins import object
+
+import pytest
+import time
+
+from boto.dynamodb2.types import NUMBER
+
+from kiwi import *
+from kiwi.throttle import TokenBucket, CapacityLimiter
+
+
+class TestTokenBucket(object):
+    def test_basic(self):
+        bucket = TokenBucket(10)
+        assert bucket.tokens == 10
+        bucket.wait()
+        bucket.consume(12)
+        assert bucket.tokens < 0
+
+        start = time.time()
+        bucket.wait()
+        assert time.time() - start >= 0.15
+        assert bucket.tokens > 0
+
+        with pytest.raises(ArgumentError):
+            TokenBucket(0)
+
+    def test_throttled(self):
+        bucket = TokenBucket(10)
+        bucket.throttled()
+        assert bucket.tokens <= 0.1
+        assert bucket._factor == 0.5
+        bucket.consume(0)
+        assert bucket._factor > 0.5
+
+
+class TestLimiter(object):
+    def test_config(self):
+        md = MetaData(limiter=True)
+        assert isinstance(md.limiter, CapacityLimiter)
+
+        md = MetaData()
+        assert md.limiter is None
+        md.configure(limiter=CapacityLimiter(ratio=0.5))
+        assert md.limiter.ratio == 0.5
+
+        with pytest.raises(ArgumentError):
+            MetaData(limiter='abc')
+        with pytest.raises(ArgumentError):
+            CapacityLimiter(ratio=0)
+
+    def test_buckets(self):
+        limiter = CapacityLimiter(ratio=0.5)
+        md = MetaData(connection='DummyConnection', limiter=limiter)
+
+        class Post(Table):
+            __metadata__ = md
+            __throughput__ = {'read': 10, 'write': 4}
+            id = HashKeyField(data_type=NUMBER)
+            time = RangeKeyField(data_type=NUMBER)
+            author = Field()
+
+            author_index = GlobalAllIndex(parts=[author, time],
+                                          throughput={'read': 2, 'write': 2})
+            plain_index = GlobalAllIndex(parts=[author, id])
+
+        assert limiter.bucket(md, 'post', None, 'read').rate == 5
+        assert limiter.bucket(md, 'post', None, 'write').rate == 2
+        assert limiter.bucket(md, 'post', 'author_index', 'read').rate == 1
+        assert limiter.bucket(md, 'post', 'plain_index', 'read') is None
+        assert limiter.bucket(md, 'nothing', None, 'read') is None
+
+        md.clear()
+
+
+class TestThrottledRequests(object):
+    def test_consume(self, local_db):
+        md = MetaData(connection=local_db, limiter=True)
+
+        class Throttled(Table):
+            __metadata__ = md
+            __throughput__ = {'read': 1, 'write': 1}
+            id = HashKeyField(data_type=NUMBER)
+            name = Field()
+
+        Throttled.create()
+        try:
+            limiter = md.limiter
+            write = limiter.bucket(md, 'throttled', None, 'write')
+            read = limiter.bucket(md, 'throttled', None, 'read')
+
+            Throttled(id=1, name='a').save()
+            assert write.tokens < 0.9
+
+            assert Throttled.get(1).name == 'a'
+            assert read.tokens < 0.9
+        finally:
+            Throttled.drop()
+            md.clear()